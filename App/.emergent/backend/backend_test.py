@@ -1,8 +1,29 @@
-import requests
+import aiohttp
+import asyncio
+import contextvars
 import sys
 import json
 from datetime import datetime
-import time
+
+# Transient gateway errors are retried with exponential backoff
+RETRY_STATUSES = {502, 503, 504}
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.3
+
+# AI-backed endpoints wait on the LLM; everything else should answer quickly
+AI_TIMEOUT = 30
+DEFAULT_TIMEOUT = 5
+
+# Output buffer of the test running in the current task, if any
+_test_output = contextvars.ContextVar("test_output", default=None)
+
+def log(*args):
+    """print(), but buffered per test so concurrent tests don't interleave"""
+    buffer = _test_output.get()
+    if buffer is None:
+        print(*args)
+    else:
+        buffer.append(" ".join(str(arg) for arg in args))
 
 class MoodSpaceAPITester:
     def __init__(self, base_url="https://mindaid-2.preview.emergentagent.com"):
@@ -12,58 +33,72 @@ class MoodSpaceAPITester:
         self.tests_run = 0
         self.tests_passed = 0
         self.mood_entry_id = None
+        # Shared aiohttp.ClientSession, opened in main()
+        self.session = None
+
+    async def _request(self, method, url, data=None, params=None, timeout=DEFAULT_TIMEOUT):
+        """Send a request, retrying connection errors and gateway errors"""
+        for attempt in range(MAX_RETRIES + 1):
+            last_attempt = attempt == MAX_RETRIES
+            try:
+                async with self.session.request(
+                    method, url, json=data, params=params,
+                    timeout=aiohttp.ClientTimeout(total=timeout)
+                ) as response:
+                    if response.status not in RETRY_STATUSES or last_attempt:
+                        return response.status, await response.text()
+            except aiohttp.ClientConnectionError:
+                if last_attempt:
+                    raise
+            await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
 
-    def run_test(self, name, method, endpoint, expected_status, data=None, params=None):
+    async def run_test(self, name, method, endpoint, expected_status, data=None, params=None, ai=False):
         """Run a single API test"""
         url = f"{self.api_url}/{endpoint}" if endpoint else f"{self.api_url}"
-        headers = {'Content-Type': 'application/json'}
+        timeout = AI_TIMEOUT if ai else DEFAULT_TIMEOUT
 
         self.tests_run += 1
-        print(f"\n🔍 Testing {name}...")
-        print(f"   URL: {url}")
+        log(f"\n🔍 Testing {name}...")
+        log(f"   URL: {url}")
         
         try:
-            if method == 'GET':
-                response = requests.get(url, headers=headers, params=params, timeout=30)
-            elif method == 'POST':
-                response = requests.post(url, json=data, headers=headers, timeout=30)
-
-            print(f"   Status Code: {response.status_code}")
+            status, body = await self._request(method, url, data=data, params=params, timeout=timeout)
+            log(f"   Status Code: {status}")
             
-            success = response.status_code == expected_status
+            success = status == expected_status
             if success:
                 self.tests_passed += 1
-                print(f"✅ Passed - Status: {response.status_code}")
+                log(f"✅ Passed - Status: {status}")
                 try:
-                    response_data = response.json()
+                    response_data = json.loads(body)
                     if isinstance(response_data, dict) and len(str(response_data)) < 500:
-                        print(f"   Response: {response_data}")
+                        log(f"   Response: {response_data}")
                     elif isinstance(response_data, list):
-                        print(f"   Response: List with {len(response_data)} items")
+                        log(f"   Response: List with {len(response_data)} items")
                     return True, response_data
                 except:
                     return True, {}
             else:
-                print(f"❌ Failed - Expected {expected_status}, got {response.status_code}")
+                log(f"❌ Failed - Expected {expected_status}, got {status}")
                 try:
-                    error_data = response.json()
-                    print(f"   Error: {error_data}")
+                    error_data = json.loads(body)
+                    log(f"   Error: {error_data}")
                 except:
-                    print(f"   Error: {response.text}")
+                    log(f"   Error: {body}")
                 return False, {}
 
-        except requests.exceptions.Timeout:
-            print(f"❌ Failed - Request timeout (30s)")
+        except asyncio.TimeoutError:
+            log(f"❌ Failed - Request timeout ({timeout}s)")
             return False, {}
         except Exception as e:
-            print(f"❌ Failed - Error: {str(e)}")
+            log(f"❌ Failed - Error: {str(e)}")
             return False, {}
 
-    def test_root_endpoint(self):
+    async def test_root_endpoint(self):
         """Test the root API endpoint"""
-        return self.run_test("Root API Endpoint", "GET", "", 200)
+        return await self.run_test("Root API Endpoint", "GET", "", 200)
 
-    def test_create_mood_entry(self):
+    async def test_create_mood_entry(self):
         """Test creating a mood entry with AI insights"""
         mood_data = {
             "user_session": self.session_id,
@@ -72,60 +107,62 @@ class MoodSpaceAPITester:
             "description": "Had a good day today. Spent time with family and felt really connected. The weather was nice and I managed to complete my work on time."
         }
         
-        print("   Note: This test may take 10-15 seconds due to AI processing...")
-        success, response = self.run_test(
+        log("   Note: This test may take 10-15 seconds due to AI processing...")
+        success, response = await self.run_test(
             "Create Mood Entry with AI Insights",
             "POST",
             "mood",
             200,
-            data=mood_data
+            data=mood_data,
+            ai=True
         )
         
         if success and 'id' in response:
             self.mood_entry_id = response['id']
-            print(f"   Mood Entry ID: {self.mood_entry_id}")
+            log(f"   Mood Entry ID: {self.mood_entry_id}")
             if 'ai_insights' in response and response['ai_insights']:
-                print(f"   AI Insights Generated: ✅")
-                print(f"   AI Response Preview: {response['ai_insights'][:100]}...")
+                log(f"   AI Insights Generated: ✅")
+                log(f"   AI Response Preview: {response['ai_insights'][:100]}...")
             else:
-                print(f"   AI Insights: ❌ Missing or empty")
+                log(f"   AI Insights: ❌ Missing or empty")
         
         return success
 
-    def test_get_user_moods(self):
+    async def test_get_user_moods(self):
         """Test retrieving user mood entries"""
-        return self.run_test(
+        return await self.run_test(
             "Get User Mood Entries",
             "GET",
             f"mood/{self.session_id}",
             200
         )
 
-    def test_ai_chat(self):
+    async def test_ai_chat(self):
         """Test AI chat functionality"""
         chat_data = {
             "user_session": self.session_id,
             "message": "I'm feeling a bit overwhelmed with my studies. Can you help me?"
         }
         
-        print("   Note: This test may take 10-15 seconds due to AI processing...")
-        success, response = self.run_test(
+        log("   Note: This test may take 10-15 seconds due to AI processing...")
+        success, response = await self.run_test(
             "AI Chat Companion",
             "POST",
             "chat",
             200,
-            data=chat_data
+            data=chat_data,
+            ai=True
         )
         
         if success and 'response' in response:
-            print(f"   AI Response Generated: ✅")
-            print(f"   AI Response Preview: {response['response'][:150]}...")
+            log(f"   AI Response Generated: ✅")
+            log(f"   AI Response Preview: {response['response'][:150]}...")
         
         return success
 
-    def test_wellness_challenges(self):
+    async def test_wellness_challenges(self):
         """Test wellness challenges endpoint"""
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Get Wellness Challenges",
             "GET",
             "challenges",
@@ -133,41 +170,42 @@ class MoodSpaceAPITester:
         )
         
         if success and isinstance(response, list):
-            print(f"   Challenges Found: {len(response)}")
+            log(f"   Challenges Found: {len(response)}")
             for challenge in response[:2]:  # Show first 2 challenges
-                print(f"   - {challenge.get('title', 'Unknown')}: {challenge.get('points', 0)} points")
+                log(f"   - {challenge.get('title', 'Unknown')}: {challenge.get('points', 0)} points")
         
         return success
 
-    def test_user_progress(self):
+    async def test_user_progress(self):
         """Test user progress tracking"""
-        return self.run_test(
+        return await self.run_test(
             "Get User Progress",
             "GET",
             f"progress/{self.session_id}",
             200
         )
 
-    def test_mood_analytics(self):
+    async def test_mood_analytics(self):
         """Test mood analytics with AI pattern analysis"""
-        print("   Note: This test may take 10-15 seconds due to AI processing...")
-        success, response = self.run_test(
+        log("   Note: This test may take 10-15 seconds due to AI processing...")
+        success, response = await self.run_test(
             "Get Mood Analytics",
             "GET",
             f"analytics/{self.session_id}",
-            200
+            200,
+            ai=True
         )
         
         if success:
             if 'analysis' in response and response['analysis']:
-                print(f"   AI Analysis Generated: ✅")
-                print(f"   Analysis Preview: {response['analysis'][:100]}...")
+                log(f"   AI Analysis Generated: ✅")
+                log(f"   Analysis Preview: {response['analysis'][:100]}...")
             if 'average_mood' in response:
-                print(f"   Average Mood: {response['average_mood']}")
+                log(f"   Average Mood: {response['average_mood']}")
         
         return success
 
-    def test_anonymous_stories(self):
+    async def test_anonymous_stories(self):
         """Test anonymous story functionality"""
         # Test creating a story
         story_data = {
@@ -177,7 +215,7 @@ class MoodSpaceAPITester:
             "category": "anxiety"
         }
         
-        success1, response1 = self.run_test(
+        success1, response1 = await self.run_test(
             "Create Anonymous Story",
             "POST",
             "stories",
@@ -186,7 +224,7 @@ class MoodSpaceAPITester:
         )
         
         # Test getting approved stories
-        success2, response2 = self.run_test(
+        success2, response2 = await self.run_test(
             "Get Approved Stories",
             "GET",
             "stories",
@@ -195,35 +233,50 @@ class MoodSpaceAPITester:
         
         return success1 and success2
 
-def main():
+async def run_tests(tests):
+    """Run each (name, coroutine function) pair and swallow per-test exceptions"""
+    async def run_one(test_name, test_func):
+        # Each gathered test runs in its own task, so this buffer is per test
+        buffer = []
+        _test_output.set(buffer)
+        try:
+            await test_func()
+        except Exception as e:
+            log(f"❌ Test failed with exception: {str(e)}")
+        print(f"\n{'='*20} {test_name} {'='*20}")
+        print("\n".join(buffer))
+    
+    await asyncio.gather(*(run_one(test_name, test_func) for test_name, test_func in tests))
+
+async def main():
     print("🚀 Starting MoodSpace API Testing...")
     print("=" * 60)
     
     tester = MoodSpaceAPITester()
     
-    # Test sequence
-    tests = [
+    # Independent tests run concurrently so the AI-bound ones overlap
+    independent_tests = [
         ("Root Endpoint", tester.test_root_endpoint),
         ("Mood Entry Creation", tester.test_create_mood_entry),
-        ("User Moods Retrieval", tester.test_get_user_moods),
         ("AI Chat", tester.test_ai_chat),
         ("Wellness Challenges", tester.test_wellness_challenges),
         ("User Progress", tester.test_user_progress),
-        ("Mood Analytics", tester.test_mood_analytics),
         ("Anonymous Stories", tester.test_anonymous_stories),
     ]
+    # These read back the mood entry created above
+    dependent_tests = [
+        ("User Moods Retrieval", tester.test_get_user_moods),
+        ("Mood Analytics", tester.test_mood_analytics),
+    ]
     
     print(f"Session ID: {tester.session_id}")
     
-    for test_name, test_func in tests:
-        print(f"\n{'='*20} {test_name} {'='*20}")
-        try:
-            test_func()
-        except Exception as e:
-            print(f"❌ Test failed with exception: {str(e)}")
-        
-        # Small delay between tests
-        time.sleep(1)
+    async with aiohttp.ClientSession(
+        headers={'Content-Type': 'application/json'},
+    ) as session:
+        tester.session = session
+        await run_tests(independent_tests)
+        await run_tests(dependent_tests)
     
     # Print final results
     print(f"\n{'='*60}")
@@ -242,4 +295,4 @@ def main():
         return 1
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
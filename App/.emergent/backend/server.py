@@ -1,13 +1,20 @@
 from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, WriteConcern
+from pymongo.errors import DuplicateKeyError
 import os
+import asyncio
 import logging
 from pathlib import Path
+from string import Template
+from cachetools import LRUCache, TTLCache
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set, Type
 import uuid
+import itertools
 from datetime import datetime, timezone
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 
@@ -18,9 +25,11 @@ load_dotenv(ROOT_DIR / '.env')
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
+# Chat logs are low-value writes; don't wait for the server to acknowledge them
+chat_log = db.get_collection("chat_history", write_concern=WriteConcern(w=0))
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -36,6 +45,51 @@ def get_llm_chat(session_id: str, system_message: str = "You are a supportive me
     ).with_model("gemini", "gemini-2.0-flash")
     return chat
 
+# Prompt templates, compiled once at import
+INSIGHT_PROMPT = Template("""A young person has shared their mood:
+Mood Score: $score/10
+Emotions: $emotions
+Description: $description
+
+Provide a brief, culturally sensitive insight (2-3 sentences) that acknowledges their feelings and offers gentle guidance or encouragement. Consider Indian cultural context.
+""")
+
+PATTERN_PROMPT = Template("""Analyze this 2-week mood pattern for a young person:
+$moods
+
+Provide a brief, encouraging analysis (3-4 sentences) highlighting:
+1. Any positive trends or patterns
+2. Areas for gentle attention
+3. One specific, actionable suggestion for improvement
+
+Be supportive and focus on growth rather than problems.
+""")
+
+BATCHED_PATTERN_PROMPT = Template("""---
+Also, given these recent entries (newest first):
+$moods
+
+After the insight, provide a brief, encouraging pattern analysis (3-4 sentences) prefixed with '$marker', highlighting positive trends, areas for gentle attention and one actionable suggestion.
+""")
+
+# Strong references to fire-and-forget tasks so they aren't garbage collected
+_background_tasks = set()
+
+def _log_task_error(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task failed", exc_info=task.exception())
+
+def run_in_background(coro):
+    """Schedule a coroutine whose result the response doesn't need"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_log_task_error)
+    return task
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
 # Define Models
 class MoodEntry(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -43,7 +97,7 @@ class MoodEntry(BaseModel):
     mood_score: int  # 1-10 scale
     emotions: List[str]
     description: str
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    timestamp: datetime = Field(default_factory=_now)
     ai_insights: Optional[str] = None
 
 class MoodEntryCreate(BaseModel):
@@ -59,7 +113,7 @@ class AnonymousStory(BaseModel):
     story: str
     category: str
     is_approved: bool = False
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    timestamp: datetime = Field(default_factory=_now)
     support_count: int = 0
 
 class AnonymousStoryCreate(BaseModel):
@@ -76,6 +130,48 @@ class WellnessChallenge(BaseModel):
     points: int
     duration_days: int
 
+# Pre-defined challenges, built once. Ids are derived from the title so they
+# stay the same across requests, restarts and workers.
+CHALLENGE_ID_NAMESPACE = uuid.UUID("6f1c5b9e-3d2a-4e8b-9a47-2c1d0e5f8b63")
+
+def challenge_id(title: str) -> str:
+    return str(uuid.uuid5(CHALLENGE_ID_NAMESPACE, title))
+
+STATIC_CHALLENGES = [
+    WellnessChallenge(
+        id=challenge_id("Daily Gratitude"),
+        title="Daily Gratitude",
+        description="Write down 3 things you're grateful for each day",
+        category="mindfulness",
+        points=10,
+        duration_days=7
+    ),
+    WellnessChallenge(
+        id=challenge_id("5-Minute Breathing"),
+        title="5-Minute Breathing",
+        description="Practice deep breathing for 5 minutes daily",
+        category="relaxation",
+        points=15,
+        duration_days=5
+    ),
+    WellnessChallenge(
+        id=challenge_id("Digital Detox Hour"),
+        title="Digital Detox Hour",
+        description="Stay off social media for 1 hour each day",
+        category="balance",
+        points=20,
+        duration_days=3
+    ),
+    WellnessChallenge(
+        id=challenge_id("Connect with Nature"),
+        title="Connect with Nature",
+        description="Spend 15 minutes outdoors daily",
+        category="nature",
+        points=12,
+        duration_days=7
+    )
+]
+
 class UserProgress(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_session: str
@@ -89,61 +185,104 @@ class ChatMessage(BaseModel):
     user_session: str
     message: str
     response: str
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    timestamp: datetime = Field(default_factory=_now)
 
 class ChatRequest(BaseModel):
     user_session: str
     message: str
 
+def new_document(model: Type[BaseModel], exclude: Optional[Set[str]] = None, **values) -> Dict[str, Any]:
+    """Mongo document for a new record, with the model's defaults filled in.
+    
+    The values come from already-validated request models, so this skips
+    validation rather than round-tripping through the model constructor.
+    """
+    return model.model_construct(**values).model_dump(exclude=exclude)
+
 # Routes
 @api_router.get("/")
 async def root():
     return {"message": "MoodSpace API - Supporting Youth Mental Wellness"}
 
 # Mood Tracking
+# Every Nth entry also asks for the /analytics pattern analysis in the same
+# LLM call, so the next analytics view is served from cache
+ANALYTICS_BATCH_INTERVAL = 7
+PATTERN_MARKER = "PATTERN:"
+# Sessions whose next entry is an Nth one, learned from the progress upsert
+# of their previous entry. Best effort: a restart or another worker just
+# skips the batching and /analytics asks the LLM itself.
+_pattern_due = TTLCache(maxsize=10_000, ttl=7 * 24 * 3600)
+
 @api_router.post("/mood", response_model=MoodEntry)
 async def create_mood_entry(mood_data: MoodEntryCreate):
     try:
+        mood_doc = new_document(MoodEntry, **mood_data.model_dump())
+        
         # Generate AI insights based on mood data
         chat = get_llm_chat(mood_data.user_session)
         
-        insight_prompt = f"""
-        A young person has shared their mood:
-        Mood Score: {mood_data.mood_score}/10
-        Emotions: {', '.join(mood_data.emotions)}
-        Description: {mood_data.description}
+        insight_prompt = INSIGHT_PROMPT.substitute(
+            score=mood_data.mood_score,
+            emotions=", ".join(mood_data.emotions),
+            description=mood_data.description
+        )
         
-        Provide a brief, culturally sensitive insight (2-3 sentences) that acknowledges their feelings and offers gentle guidance or encouragement. Consider Indian cultural context.
-        """
+        pattern_stats = None
+        if _pattern_due.pop(mood_data.user_session, False):
+            previous = await db.mood_entries.find(
+                {"user_session": mood_data.user_session},
+                {"timestamp": 1, "mood_score": 1, "emotions": 1, "_id": 0}
+            ).sort("timestamp", -1).limit(13).to_list(13)
+            rows = [mood_doc] + previous
+            pattern_stats = {
+                "rows": rows,
+                "avg_mood": sum(row["mood_score"] for row in rows) / len(rows),
+                "count": len(rows),
+                "latest_score": mood_data.mood_score,
+                "latest_id": mood_doc["id"]
+            }
+            insight_prompt += "\n" + BATCHED_PATTERN_PROMPT.substitute(
+                moods=format_mood_rows(rows),
+                marker=PATTERN_MARKER
+            )
         
         user_message = UserMessage(text=insight_prompt)
         ai_response = await chat.send_message(user_message)
         
-        mood_dict = mood_data.dict()
-        mood_dict['ai_insights'] = ai_response
-        mood_obj = MoodEntry(**mood_dict)
+        if pattern_stats is not None:
+            insight, marker, analysis = ai_response.partition(PATTERN_MARKER)
+            if marker:
+                ai_response = insight.strip().rstrip("-").strip()
+                key = (mood_data.user_session, mood_doc["id"])
+                _batched_analytics[key] = summarize_mood_pattern(analysis.strip(), pattern_stats)
         
-        await db.mood_entries.insert_one(mood_obj.dict())
+        mood_doc["ai_insights"] = ai_response
         
-        # Update user progress
-        await update_user_progress(mood_data.user_session, "mood_entry")
+        # Save the entry and update user progress concurrently
+        _, entry_count = await asyncio.gather(
+            db.mood_entries.insert_one(mood_doc),
+            update_user_progress(mood_data.user_session, "mood_entry")
+        )
+        if (entry_count + 1) % ANALYTICS_BATCH_INTERVAL == 0:
+            _pattern_due[mood_data.user_session] = True
         
-        return mood_obj
+        return MoodEntry.model_construct(**mood_doc)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/mood/{user_session}", response_model=List[MoodEntry])
 async def get_user_moods(user_session: str, limit: int = 30):
-    moods = await db.mood_entries.find({"user_session": user_session}).sort("timestamp", -1).limit(limit).to_list(limit)
-    return [MoodEntry(**mood) for mood in moods]
+    moods = await db.mood_entries.find({"user_session": user_session}, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
+    # Stored documents were validated on insert; skip re-validation
+    return [MoodEntry.model_construct(**mood) for mood in moods]
 
 # Anonymous Story Sharing
 @api_router.post("/stories", response_model=AnonymousStory)
 async def create_story(story_data: AnonymousStoryCreate):
-    story_dict = story_data.dict()
-    story_obj = AnonymousStory(**story_dict)
-    await db.stories.insert_one(story_obj.dict())
-    return story_obj
+    story_doc = new_document(AnonymousStory, **story_data.model_dump())
+    await db.stories.insert_one(story_doc)
+    return AnonymousStory.model_construct(**story_doc)
 
 @api_router.get("/stories", response_model=List[AnonymousStory])
 async def get_approved_stories(category: Optional[str] = None, limit: int = 20):
@@ -151,8 +290,8 @@ async def get_approved_stories(category: Optional[str] = None, limit: int = 20):
     if category:
         query["category"] = category
     
-    stories = await db.stories.find(query).sort("timestamp", -1).limit(limit).to_list(limit)
-    return [AnonymousStory(**story) for story in stories]
+    stories = await db.stories.find(query, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
+    return [AnonymousStory.model_construct(**story) for story in stories]
 
 @api_router.post("/stories/{story_id}/support")
 async def support_story(story_id: str):
@@ -184,13 +323,14 @@ async def chat_with_ai(chat_request: ChatRequest):
         user_message = UserMessage(text=chat_request.message)
         ai_response = await chat.send_message(user_message)
         
-        # Save chat history
-        chat_obj = ChatMessage(
+        # Save chat history without holding up the reply
+        chat_doc = new_document(
+            ChatMessage,
             user_session=chat_request.user_session,
             message=chat_request.message,
             response=ai_response
         )
-        await db.chat_history.insert_one(chat_obj.dict())
+        run_in_background(chat_log.insert_one(chat_doc))
         
         return {"response": ai_response}
     except Exception as e:
@@ -199,114 +339,134 @@ async def chat_with_ai(chat_request: ChatRequest):
 # Wellness Challenges
 @api_router.get("/challenges", response_model=List[WellnessChallenge])
 async def get_wellness_challenges():
-    # Pre-defined challenges
-    challenges = [
-        {
-            "id": str(uuid.uuid4()),
-            "title": "Daily Gratitude",
-            "description": "Write down 3 things you're grateful for each day",
-            "category": "mindfulness",
-            "points": 10,
-            "duration_days": 7
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "title": "5-Minute Breathing",
-            "description": "Practice deep breathing for 5 minutes daily",
-            "category": "relaxation",
-            "points": 15,
-            "duration_days": 5
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "title": "Digital Detox Hour",
-            "description": "Stay off social media for 1 hour each day",
-            "category": "balance",
-            "points": 20,
-            "duration_days": 3
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "title": "Connect with Nature",
-            "description": "Spend 15 minutes outdoors daily",
-            "category": "nature",
-            "points": 12,
-            "duration_days": 7
-        }
-    ]
-    return [WellnessChallenge(**challenge) for challenge in challenges]
+    return STATIC_CHALLENGES
 
 # User Progress
+# Short-lived cache; update_user_progress evicts a session's entry on write
+_progress_cache = TTLCache(maxsize=10_000, ttl=10)
+# Sequence number of each session's latest progress write. A read only fills
+# the cache if no write happened while it was in flight.
+_progress_writes = TTLCache(maxsize=10_000, ttl=60)
+_progress_write_seq = itertools.count(1)
+
 @api_router.get("/progress/{user_session}", response_model=UserProgress)
 async def get_user_progress(user_session: str):
-    progress = await db.user_progress.find_one({"user_session": user_session})
-    if not progress:
-        # Create new progress record
-        progress_obj = UserProgress(user_session=user_session)
-        await db.user_progress.insert_one(progress_obj.dict())
-        return progress_obj
-    return UserProgress(**progress)
-
-async def update_user_progress(user_session: str, activity_type: str, points: int = 5):
-    """Helper function to update user progress"""
-    progress = await db.user_progress.find_one({"user_session": user_session})
-    if not progress:
-        progress_obj = UserProgress(user_session=user_session, total_points=points)
-        if activity_type == "mood_entry":
-            progress_obj.mood_entries_count = 1
-        await db.user_progress.insert_one(progress_obj.dict())
-    else:
-        update_data = {"$inc": {"total_points": points}}
-        if activity_type == "mood_entry":
-            update_data["$inc"]["mood_entries_count"] = 1
-        await db.user_progress.update_one(
-            {"user_session": user_session},
-            update_data
-        )
+    cached = _progress_cache.get(user_session)
+    if cached is not None:
+        return cached
+    write_seq = _progress_writes.get(user_session)
+    # Create a new progress record if needed; an upsert can't race the
+    # unique index the way find_one + insert_one could
+    defaults = new_document(UserProgress, exclude={"user_session"}, user_session=user_session)
+    progress = await db.user_progress.find_one_and_update(
+        {"user_session": user_session},
+        {"$setOnInsert": defaults},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    progress_obj = UserProgress(**progress)
+    if _progress_writes.get(user_session) == write_seq:
+        _progress_cache[user_session] = progress_obj
+    return progress_obj
+
+async def update_user_progress(user_session: str, activity_type: str, points: int = 5) -> int:
+    """Helper function to update user progress; returns the new mood entry count"""
+    inc = {"total_points": points}
+    if activity_type == "mood_entry":
+        inc["mood_entries_count"] = 1
+    defaults = new_document(UserProgress, exclude={"user_session", *inc}, user_session=user_session)
+    progress = await db.user_progress.find_one_and_update(
+        {"user_session": user_session},
+        {"$inc": inc, "$setOnInsert": defaults},
+        projection={"mood_entries_count": 1, "_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    _progress_writes[user_session] = next(_progress_write_seq)
+    _progress_cache.pop(user_session, None)
+    return progress["mood_entries_count"]
 
 # Analytics for patterns
+# Results are keyed by (user_session, latest mood entry id), so a new entry
+# naturally misses the cache
+_analytics_cache = TTLCache(maxsize=10_000, ttl=60)
+# Analyses batched into a mood insight call. Their key already changes with
+# every new entry, so they live until evicted rather than expiring after 60s
+_batched_analytics = LRUCache(maxsize=10_000)
+# In-flight analyses, so concurrent requests for the same key share one LLM call
+_analytics_inflight: Dict[tuple, asyncio.Future] = {}
+
+def format_mood_rows(rows: List[Dict[str, Any]]) -> str:
+    """One prompt line per mood entry, newest first"""
+    return "\n".join(
+        f"Date: {mood['timestamp']:%Y-%m-%d}, Score: {mood['mood_score']}, Emotions: {', '.join(mood['emotions'])}"
+        for mood in rows
+    )
+
+def summarize_mood_pattern(analysis: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the /analytics response from an analysis and its mood stats"""
+    avg_mood = stats["avg_mood"]
+    result = {
+        "analysis": analysis,
+        "average_mood": round(avg_mood, 1),
+        "total_entries": stats["count"],
+        "trend": "improving" if stats["latest_score"] > avg_mood else "stable"
+    }
+    return result
+
+async def analyze_mood_pattern(user_session: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Ask the LLM for a pattern analysis of the aggregated recent moods"""
+    # Generate AI insights on patterns
+    chat = get_llm_chat(user_session)
+    
+    pattern_prompt = PATTERN_PROMPT.substitute(moods=format_mood_rows(stats["rows"]))
+    
+    user_message = UserMessage(text=pattern_prompt)
+    analysis = await chat.send_message(user_message)
+    
+    result = summarize_mood_pattern(analysis, stats)
+    _analytics_cache[(user_session, stats["latest_id"])] = result
+    return result
+
 @api_router.get("/analytics/{user_session}")
 async def get_mood_analytics(user_session: str):
     try:
-        # Get recent mood entries
-        recent_moods = await db.mood_entries.find(
-            {"user_session": user_session}
-        ).sort("timestamp", -1).limit(14).to_list(14)
+        # Get recent mood entries and their stats in one round trip
+        pipeline = [
+            {"$match": {"user_session": user_session}},
+            {"$sort": {"timestamp": -1}},
+            {"$limit": 14},
+            {"$group": {
+                "_id": None,
+                "avg_mood": {"$avg": "$mood_score"},
+                "count": {"$sum": 1},
+                "latest_score": {"$first": "$mood_score"},
+                "latest_id": {"$first": "$id"},
+                "rows": {"$push": {
+                    "timestamp": "$timestamp",
+                    "mood_score": "$mood_score",
+                    "emotions": "$emotions"
+                }}
+            }}
+        ]
+        result = await db.mood_entries.aggregate(pipeline).to_list(1)
         
-        if not recent_moods:
+        if not result:
             return {"message": "No mood data available"}
         
-        # Generate AI insights on patterns
-        chat = get_llm_chat(user_session)
-        
-        mood_data = []
-        for mood in recent_moods:
-            mood_data.append(f"Date: {mood['timestamp'].strftime('%Y-%m-%d')}, Score: {mood['mood_score']}, Emotions: {', '.join(mood['emotions'])}")
-        
-        pattern_prompt = f"""
-        Analyze this 2-week mood pattern for a young person:
-        {chr(10).join(mood_data)}
-        
-        Provide a brief, encouraging analysis (3-4 sentences) highlighting:
-        1. Any positive trends or patterns
-        2. Areas for gentle attention
-        3. One specific, actionable suggestion for improvement
+        stats = result[0]
+        key = (user_session, stats["latest_id"])
+        cached = _analytics_cache.get(key) or _batched_analytics.get(key)
+        if cached is not None:
+            return cached
         
-        Be supportive and focus on growth rather than problems.
-        """
-        
-        user_message = UserMessage(text=pattern_prompt)
-        analysis = await chat.send_message(user_message)
-        
-        # Calculate basic stats
-        avg_mood = sum(mood['mood_score'] for mood in recent_moods) / len(recent_moods)
-        
-        return {
-            "analysis": analysis,
-            "average_mood": round(avg_mood, 1),
-            "total_entries": len(recent_moods),
-            "trend": "improving" if recent_moods[0]['mood_score'] > avg_mood else "stable"
-        }
+        pending = _analytics_inflight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(analyze_mood_pattern(user_session, stats))
+            _analytics_inflight[key] = pending
+            pending.add_done_callback(lambda _: _analytics_inflight.pop(key, None))
+        # Shield so one client disconnecting doesn't cancel the shared call
+        return await asyncio.shield(pending)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -328,6 +488,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    # Back the per-session "newest first" queries with pre-sorted index scans
+    await db.mood_entries.create_index([("user_session", 1), ("timestamp", -1)])
+    await db.chat_history.create_index([("user_session", 1), ("timestamp", -1)])
+    await db.stories.create_index([("is_approved", 1), ("category", 1), ("timestamp", -1)])
+    try:
+        await db.user_progress.create_index("user_session", unique=True)
+    except DuplicateKeyError:
+        # Older find_one + insert_one races may have left duplicate records;
+        # keep serving without the unique index until they are cleaned up
+        logger.warning("Duplicate user_progress.user_session values; unique index not created")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Let pending background writes finish before the connection goes away
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
     client.close()
\ No newline at end of file